@@ -8,42 +8,79 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import io
+import copy
+import contextlib
+import csv
 import json
 import datetime
 import threading
 import asyncio
 import uuid
 import time
+import queue
+import collections
+import functools
+import atexit
+import tempfile
+import hashlib
+import hmac
+import secrets
+import re
 from pathlib import Path
-from urllib.request import urlretrieve
 from flask import (
     Flask, render_template, request, send_from_directory,
-    redirect, url_for, session, jsonify
+    redirect, url_for, session, jsonify, make_response, Response
 )
+from flask import Request as FlaskRequest
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.utils import secure_filename
 
 # Optional Telegram
 try:
     from aiogram import Bot, Dispatcher, types
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.exceptions import TelegramRetryAfter
     from aiogram.filters import Command
     from aiogram.fsm.storage.memory import MemoryStorage
 except Exception:
     Bot = None
     Dispatcher = None
     types = None
+    AiohttpSession = None
+    TelegramRetryAfter = None
     Command = None
     MemoryStorage = None
 
+# Optional cross-process file locking (POSIX only)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Optional fast JSON (falls back to stdlib json)
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 BASE = Path(__file__).parent
 DB_FILE = BASE / "database.json"
+DB_LOCK_FILE = BASE / "database.json.lock"
+ORDERS_FILE = BASE / "orders.jsonl"
 TEMPLATES = BASE / "templates"
 STATIC = BASE / "static"
 IMAGES = STATIC / "images"
+JINJA_CACHE = BASE / ".jinja_cache"
 
-# Ensure folders
-TEMPLATES.mkdir(exist_ok=True)
-STATIC.mkdir(exist_ok=True)
-IMAGES.mkdir(parents=True, exist_ok=True)
+# Ensure folders (one directory listing instead of a syscall per path)
+_existing = {e.name for e in os.scandir(BASE)}
+for _d in (TEMPLATES, STATIC):
+    if _d.name not in _existing:
+        _d.mkdir(exist_ok=True)
+if IMAGES.name not in {e.name for e in os.scandir(STATIC)}:
+    IMAGES.mkdir(parents=True, exist_ok=True)
 
 # Env / config
 BOT_TOKEN = os.environ.get("BOT_TOKEN") or ""
@@ -56,9 +93,30 @@ except Exception:
     ORDER_GROUP_ID = None
 
 WEB_URL = os.environ.get("WEB_URL") or ""
+# with a secret set, Telegram pushes updates to WEB_URL/tg instead of being polled;
+# it comes back in the X-Telegram-Bot-Api-Secret-Token header (A-Z a-z 0-9 _ -)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or ""
 SECRET_KEY = os.environ.get("SECRET_KEY", "change-me")
 
+BOOT_ID = uuid.uuid4().hex[:8]  # changes per process start, used in cache validators
+
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif"}
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # bytes, whole request body
+PLACEHOLDER_IMAGE = "_placeholder.gif"  # served for product images missing on disk
+UPLOAD_NAME_RE = re.compile(r"[0-9a-f]{8}_")  # prefix api_upload puts on every file
+
+# --- JSON helpers ---
+def json_loads(data):
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj, indent=False):
+    if orjson:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
 
 # --- Database helpers (simple JSON) ---
 def ensure_db():
@@ -78,29 +136,289 @@ def ensure_db():
             "orders": [],
             "admins": [{"username": "admin", "password": "12345"}]
         }
-        DB_FILE.write_text(json.dumps(sample, ensure_ascii=False, indent=2), encoding="utf-8")
+        write_db(sample)
+
+
+# Parsed database.json, kept until the file changes on disk. "mtime" and
+# "hash" describe the file as last read or written here.
+_db_lock = threading.RLock()
+_DB_CACHE = {"mtime": -1, "hash": None, "data": None}
+_products_by_id = {}
+_products_json = b"[]"
+_admins_by_name = {}
+_menu_by_lang = {}
+_product_views = {}
+_flock_depth = 0
+
+PRODUCT_LANGS = ("ru", "uz")
+DEFAULT_VIEW_LANG = "uz"  # what the templates showed for any lang other than ru
+
+
+def _localize(p, lang):
+    return {
+        "id": p.get("id"),
+        "name": p.get(f"name_{lang}") or p.get("name_ru", ""),
+        "price": p.get("price", 0),
+        "image": p.get("image", ""),
+        "desc": p.get(f"desc_{lang}") or p.get("desc_ru", ""),
+    }
 
 
-def read_db():
-    ensure_db()
+@contextlib.contextmanager
+def _db_file_lock(exclusive=False):
+    # flock() on a side file so the web and bot processes don't interleave
+    # writes; database.json itself is replaced on every save, so it can't
+    # carry the lock. Nested use in the same thread reuses the outer lock.
+    global _flock_depth
+    with _db_lock:
+        if _flock_depth or not fcntl:
+            _flock_depth += 1
+            try:
+                yield
+            finally:
+                _flock_depth -= 1
+            return
+        with open(DB_LOCK_FILE, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            _flock_depth += 1
+            try:
+                yield
+            finally:
+                _flock_depth -= 1
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _db_mtime():
     try:
-        with DB_FILE.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"products": [], "orders": [], "admins": []}
+        return DB_FILE.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _set_db_snapshot(mtime_ns, digest, data):
+    # called with _db_lock held; the product index, per-language views and
+    # the /api/products body are rebuilt with the snapshot
+    global _products_by_id, _products_json, _admins_by_name, _menu_by_lang, _product_views
+    products = data.get("products", [])
+    _DB_CACHE.update(mtime=mtime_ns, hash=digest, data=data)
+    _products_by_id = {p.get("id"): p for p in products}
+    _products_json = json_dumps(products).encode("utf-8")
+    _admins_by_name = {a.get("username"): a for a in data.get("admins", [])}
+    # the menu keeps every product in order; the id map is only for lookups
+    _menu_by_lang = {lang: [_localize(p, lang) for p in products] for lang in PRODUCT_LANGS}
+    _product_views = {
+        lang: {v["id"]: v for v in views} for lang, views in _menu_by_lang.items()
+    }
+
+
+def read_db(mutable=False):
+    # callers that modify the result and write it back pass mutable=True so
+    # the shared snapshot is never changed in place
+    with _db_lock:
+        if _DB_CACHE["data"] is None or _db_mtime() != _DB_CACHE["mtime"]:
+            ensure_db()
+            try:
+                with _db_file_lock(), DB_FILE.open("r", encoding="utf-8") as f:
+                    mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                    text = f.read()
+                _set_db_snapshot(mtime_ns, hash(text), json_loads(text))
+            except Exception:
+                return {"products": [], "orders": [], "admins": []}
+        data = _DB_CACHE["data"]
+    return copy.deepcopy(data) if mutable else data
 
 
 def write_db(data):
-    with DB_FILE.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # serialize first so the file gets one write() instead of one per token,
+    # then swap it in so readers never see a half-written database.json
+    payload = json_dumps(data, indent=True)
+    digest = hash(payload)
+    with _db_file_lock(exclusive=True):
+        if (_db_mtime(), digest) == (_DB_CACHE["mtime"], _DB_CACHE["hash"]):
+            return  # nothing changed since we last saw the file
+        tmp = DB_FILE.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8", buffering=1 << 16) as f:
+            f.write(payload)
+        os.replace(tmp, DB_FILE)
+        _set_db_snapshot(_db_mtime(), digest, data)
+
+
+@contextlib.contextmanager
+def db_transaction():
+    # read-modify-write under one exclusive lock, so concurrent saves from
+    # another thread or process can't drop each other's changes
+    with _db_file_lock(exclusive=True):
+        data = read_db(mutable=True)
+        yield data
+        write_db(data)
+
+if DB_FILE.name not in _existing:
+    ensure_db()
+
+# --- Orders log (append-only, one JSON object per line) ---
+# Requests only queue the order; a background thread appends whatever piled
+# up during ORDER_FLUSH_INTERVAL in a single write.
+ORDER_FLUSH_INTERVAL = 0.2
+ORDER_RETRY_INTERVAL = 1.0  # after a failed write (disk full, permissions)
+_order_write_queue = queue.Queue()
+_unsaved_orders = []  # taken off the queue but not on disk yet
+_order_write_lock = threading.Lock()
+_order_write_wake = threading.Event()
+
+
+def append_order(order):
+    _order_write_queue.put(order)
+    _order_write_wake.set()
+
+
+def flush_orders():
+    with _order_write_lock:
+        batch = _unsaved_orders
+        while True:
+            try:
+                batch.append(_order_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        data = "".join(json_dumps(o) + "\n" for o in batch)
+        with ORDERS_FILE.open("a", encoding="utf-8", buffering=8192) as f:
+            f.write(data)
+        # only dropped once written; a failed write keeps them for the next flush
+        batch.clear()
+
+
+def _order_writer():
+    while True:
+        _order_write_wake.wait()
+        time.sleep(ORDER_FLUSH_INTERVAL)
+        _order_write_wake.clear()
+        try:
+            flush_orders()
+        except Exception as e:
+            print("Failed to save orders:", e)
+            time.sleep(ORDER_RETRY_INTERVAL)
+            _order_write_wake.set()
+
+threading.Thread(target=_order_writer, daemon=True).start()
+atexit.register(flush_orders)
+
+
+def iter_orders():
+    if not ORDERS_FILE.exists():
+        return
+    # both json and orjson decode bytes, so lines skip the utf-8 text layer
+    with ORDERS_FILE.open("rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json_loads(line)
+            except ValueError:
+                continue
+
+
+def recent_orders(limit=200):
+    return list(collections.deque(iter_orders(), maxlen=limit))
+
+
+def migrate_orders():
+    # older databases kept orders inside database.json; move them to the
+    # front of the log so it stays in chronological order
+    if not read_db().get("orders"):
+        return
+    with _order_write_lock, db_transaction() as db:
+        legacy = db.get("orders") or []
+        if not legacy:
+            return  # the other process migrated them while we waited for the lock
+        existing = ORDERS_FILE.read_text(encoding="utf-8") if ORDERS_FILE.exists() else ""
+        tmp = ORDERS_FILE.with_suffix(".jsonl.tmp")
+        with open(tmp, "w", encoding="utf-8", buffering=1 << 16) as f:
+            f.write("".join(json_dumps(o) + "\n" for o in legacy) + existing)
+        os.replace(tmp, ORDERS_FILE)
+        db["orders"] = []
+
+migrate_orders()
+
+# --- Admin passwords (scrypt, never stored in plain text) ---
+_DUMMY_SALT = secrets.token_hex(16)
+
+
+def hash_password(password, salt):
+    return hashlib.scrypt(password.encode("utf-8"), salt=bytes.fromhex(salt), n=2 ** 14, r=8, p=1).hex()
+
+
+def check_admin(username, password):
+    read_db()  # refreshes the admin index if database.json changed
+    admin = _admins_by_name.get(username) or {}
+    if admin.get("hash") and admin.get("salt"):
+        return hmac.compare_digest(hash_password(password, admin["salt"]), admin["hash"])
+    # unknown users, and entries without any credential, take as long as known ones
+    hash_password(password, _DUMMY_SALT)
+    stored = admin.get("password")
+    if not stored:
+        return False
+    return hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+
+
+def migrate_admins():
+    # databases written before hashing keep "password" in clear; hash it once
+    if not any("password" in a for a in read_db().get("admins", [])):
+        return
+    with db_transaction() as db:
+        for a in db.get("admins", []):
+            password = a.pop("password", None)
+            if password is not None:
+                a["salt"] = secrets.token_hex(16)
+                a["hash"] = hash_password(str(password), a["salt"])
+
+migrate_admins()
+
+# --- Products (served from the cached database snapshot) ---
+def list_products():
+    return read_db().get("products", [])
+
 
-# --- Utils ---
 def find_product(pid):
-    db = read_db()
-    for p in db.get("products", []):
-        if p.get("id") == pid:
-            return p
-    return None
+    read_db()  # refreshes the index if database.json changed
+    return _products_by_id.get(pid)
+
+
+def view_lang(lang):
+    # query-string lang mapped onto the languages products are stored in
+    return lang if lang in PRODUCT_LANGS else DEFAULT_VIEW_LANG
+
+
+def product_view(pid, lang):
+    # the product with name/desc already picked for lang
+    read_db()
+    return _product_views.get(view_lang(lang), {}).get(pid)
+
+
+def menu_snapshot(lang):
+    # views and the mtime they were built from, read under one lock so a
+    # reload in another thread can't pair old products with a new mtime
+    with _db_lock:
+        read_db()
+        return _menu_by_lang.get(view_lang(lang), []), _DB_CACHE["mtime"]
+
+
+def products_json():
+    read_db()
+    return _products_json
+
+# --- Utils ---
+
+_last_ts = (None, "")
+
+def now_iso():
+    # orders arriving within the same second share one formatted timestamp
+    global _last_ts
+    sec = int(time.time())
+    if sec != _last_ts[0]:
+        _last_ts = (sec, datetime.datetime.fromtimestamp(sec).isoformat())
+    return _last_ts[1]
 
 
 def generate_id(prefix="p"):
@@ -110,32 +428,79 @@ def generate_id(prefix="p"):
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXT
 
-# Create placeholder images if missing
-def ensure_sample_images():
-    db = read_db()
-    for p in db.get("products", []):
-        img = p.get("image")
-        if img:
-            path = IMAGES / img
-            if not path.exists():
-                try:
-                    path.parent.mkdir(parents=True, exist_ok=True)
-                    urlretrieve(f"https://via.placeholder.com/800x400?text={p.get('id')}", str(path))
-                except Exception:
-                    path.write_text("", encoding="utf-8")
-ensure_sample_images()
-
 # --- Flask app and routes ---
+class OrjsonProvider(DefaultJSONProvider):
+    # jsonify() and request.json through orjson; unknown types still go
+    # through Flask's default hook (dates, UUIDs, dataclasses)
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# mode plain open() would give a new file; NamedTemporaryFile always uses 0600
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+UPLOAD_FILE_MODE = 0o666 & ~_UMASK
+
+
+class UploadRequest(FlaskRequest):
+    # multipart files for /api/upload are spooled straight into IMAGES/, so
+    # saving one is a hard link instead of a copy out of /tmp; the temp
+    # name is removed when Flask closes the request
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == "api_upload":
+            return tempfile.NamedTemporaryFile("wb+", dir=IMAGES, prefix=".upload-", suffix=".part")
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__, template_folder=str(TEMPLATES), static_folder=str(STATIC))
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_SIZE
+if orjson:
+    app.json = OrjsonProvider(app)
 app.secret_key = SECRET_KEY
+# let browsers keep static files (product images) for a day
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+
+# Templates ship with the app; load them once and skip per-render mtime checks
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+# compiled template code survives restarts, so new workers skip the Jinja parser
+try:
+    JINJA_CACHE.mkdir(exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE))
+except OSError as e:
+    print("Template bytecode cache disabled:", e)
+for _tpl in ("index.html", "order.html", "ordered.html", "login.html", "admin.html"):
+    app.jinja_env.get_template(_tpl)
+
+# rendered menu pages; entries for an older database.json are never hit again
+INDEX_CACHE_SIZE = 8
+_index_html_cache = {}
 
 @app.route("/")
 def index():
-    lang = request.args.get("lang", "ru")
-    db = read_db()
-    products = db.get("products", [])
-    base_url = WEB_URL if WEB_URL else request.host_url.rstrip("/")
-    return render_template("index.html", products=products, lang=lang, web_url=base_url)
+    lang = view_lang(request.args.get("lang", "ru"))
+    # the menu only changes with database.json (or a redeploy), so let
+    # browsers revalidate with a cheap 304 instead of refetching
+    products, mtime = menu_snapshot(lang)
+    etag = f"{lang}-{mtime}-{BOOT_ID}"
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        key = (lang, mtime)
+        html = _index_html_cache.get(key)
+        if html is None:
+            html = render_template("index.html", products=products, lang=lang)
+            if len(_index_html_cache) >= INDEX_CACHE_SIZE:
+                _index_html_cache.clear()
+            _index_html_cache[key] = html
+        resp = make_response(html)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, no-cache"
+    return resp
 
 @app.route("/order/<product_id>", methods=["GET", "POST"])
 def order(product_id):
@@ -162,29 +527,39 @@ def order(product_id):
             "name": name,
             "phone": phone,
             "note": note,
-            "time": datetime.datetime.now().isoformat()
+            "time": now_iso()
         }
 
-        db = read_db()
-        db["orders"].append(order)
-        write_db(db)
+        append_order(order)
 
-        # send async telegram
+        # hand off to the telegram sender on the bot loop
         try:
-            if globals().get("aioloop"):
-                asyncio.run_coroutine_threadsafe(
-                    send_order_to_group_async(order), globals()["aioloop"]
+            if globals().get("aioloop") and globals().get("order_queue"):
+                globals()["aioloop"].call_soon_threadsafe(
+                    globals()["order_queue"].put_nowait, order
                 )
         except Exception as e:
             print("Telegram send error:", e)
 
         return render_template("ordered.html", order=order, lang=lang)
 
-    return render_template("order.html", product=product, lang=lang)
-
-@app.route("/static/<path:filename>")
-def static_files(filename):
-    return send_from_directory(str(STATIC), filename)
+    view = product_view(product_id, lang) or _localize(product, view_lang(lang))
+    return render_template("order.html", product=view, lang=lang)
+
+@app.route("/static/images/<path:filename>")
+def product_image(filename):
+    # dotfiles include uploads still being received (.upload-*.part)
+    if any(part.startswith(".") for part in filename.split("/")):
+        return "Not found", 404
+    if not (IMAGES / filename).is_file():
+        # don't let browsers hold on to the placeholder once the real image lands
+        return send_from_directory(str(IMAGES), PLACEHOLDER_IMAGE, max_age=0)
+    resp = send_from_directory(str(IMAGES), filename)
+    # uploads get a fresh uuid-prefixed name, so such a URL never changes
+    # content; shipped images keep the default max-age so they can be replaced
+    if UPLOAD_NAME_RE.match(filename):
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
 
 # --- Admin ---
 @app.route("/admin/login", methods=["GET", "POST"])
@@ -192,11 +567,9 @@ def admin_login():
     if request.method == "POST":
         username = request.form.get("username", "")
         password = request.form.get("password", "")
-        db = read_db()
-        for a in db.get("admins", []):
-            if a["username"] == username and a["password"] == password:
-                session["admin"] = username
-                return redirect(url_for("admin_panel"))
+        if check_admin(username, password):
+            session["admin"] = username
+            return redirect(url_for("admin_panel"))
         return render_template("login.html", error="Invalid credentials")
     return render_template("login.html", error=None)
 
@@ -217,15 +590,15 @@ def admin_required(f):
 @admin_required
 def admin_panel():
     lang = request.args.get("lang", "ru")
-    db = read_db()
-    return render_template("admin.html", products=db["products"], orders=db["orders"], lang=lang)
+    orders = recent_orders()
+    return render_template("admin.html", products=list_products(), orders=orders, lang=lang)
 
 # --- API endpoints ---
 @app.route("/api/products", methods=["GET", "POST"])
 def api_products():
     if request.method == "GET":
-        db = read_db()
-        return jsonify(db["products"])
+        # encoded once per database.json change, not per request
+        return Response(products_json(), mimetype="application/json")
 
     if not session.get("admin"):
         return jsonify({"error": "auth required"}), 403
@@ -242,15 +615,19 @@ def api_products():
         "desc_ru": data.get("desc_ru", "")
     }
 
-    db = read_db()
-    db["products"].append(product)
-    write_db(db)
+    with db_transaction() as db:
+        db["products"].append(product)
     return jsonify(product), 201
 
 @app.route("/api/upload", methods=["POST"])
 def api_upload():
     if not session.get("admin"):
         return jsonify({"error": "auth required"}), 403
+    # refuse before the multipart parser reads anything
+    if request.content_length is None:
+        return jsonify({"error": "length required"}), 411
+    if request.content_length > MAX_UPLOAD_SIZE:
+        return jsonify({"error": "file too large"}), 413
     if "file" not in request.files:
         return jsonify({"error": "no file"}), 400
 
@@ -263,18 +640,29 @@ def api_upload():
     filename = secure_filename(f.filename)
     filename = f"{uuid.uuid4().hex[:8]}_{filename}"
     save_path = IMAGES / filename
-    f.save(str(save_path))
+    try:
+        f.stream.flush()
+        os.link(f.stream.name, save_path)
+        os.chmod(save_path, UPLOAD_FILE_MODE)
+    except (AttributeError, OSError):
+        f.save(str(save_path))  # not spooled into IMAGES/ (or no hard links)
     return jsonify({
         "filename": filename,
         "url": f"images/{filename}"
     }), 201
 
 # --- Telegram setup ---
+TELEGRAM_POOL_SIZE = 200  # concurrent connections to api.telegram.org
+TELEGRAM_TIMEOUT = 10  # seconds per API call, so a slow reply can't pin a connection
+
 bot = None
 dp = None
 if BOT_TOKEN and Bot:
     try:
-        bot = Bot(token=BOT_TOKEN)
+        tg_session = AiohttpSession(timeout=TELEGRAM_TIMEOUT)
+        # aiogram 3.4 builds the connector lazily from these kwargs
+        tg_session._connector_init["limit"] = TELEGRAM_POOL_SIZE
+        bot = Bot(token=BOT_TOKEN, session=tg_session)
         storage = MemoryStorage() if MemoryStorage else None
         dp = Dispatcher(storage=storage)
     except Exception as e:
@@ -282,25 +670,137 @@ if BOT_TOKEN and Bot:
         bot = None
         dp = None
 
-def build_text(o):
-    return (
-        f"🆕 Yangi buyurtma\n"
-        f"Mahsulot: {o['product_name']}\n"
-        f"Miqdor: {o['qty']}\n"
-        f"Ism: {o['name']}\n"
-        f"Tel: {o['phone']}\n"
-        f"Izoh: {o['note']}\n"
-        f"Vaqt: {o['time']}"
+ORDER_TEXT = (
+    "🆕 Yangi buyurtma\n"
+    "Mahsulot: {product_name}\n"
+    "Miqdor: {qty}\n"
+    "Ism: {name}\n"
+    "Tel: {phone}\n"
+    "Izoh: {note}\n"
+    "Vaqt: {time}"
+)
+
+@functools.lru_cache(maxsize=1024)
+def build_text(product_name, qty, name, phone, note, time):
+    # keyed on the fields the template uses, so a re-sent order is a cache hit
+    return ORDER_TEXT.format(
+        product_name=product_name, qty=qty, name=name, phone=phone, note=note, time=time
     )
 
-async def send_order_to_group_async(order):
+def order_text(o):
+    return build_text(o["product_name"], o["qty"], o["name"], o["phone"], o["note"], o["time"])
+
+# Telegram allows about 20 messages a minute into one group; going faster
+# only earns 429s. Orders queue up meanwhile; order_sender drains the whole
+# queue once a slot frees up, so a backlog leaves in as few messages as fit.
+GROUP_RATE_LIMIT = 20
+GROUP_RATE_PERIOD = 60.0
+_group_sends = collections.deque()
+
+async def wait_group_slot():
+    # sliding window over recent sends; only order_sender calls this
+    loop = asyncio.get_running_loop()
+    while _group_sends and loop.time() - _group_sends[0] >= GROUP_RATE_PERIOD:
+        _group_sends.popleft()
+    if len(_group_sends) >= GROUP_RATE_LIMIT:
+        await asyncio.sleep(_group_sends.popleft() + GROUP_RATE_PERIOD - loop.time())
+    _group_sends.append(loop.time())
+
+def pack_messages(texts, limit=4096):
+    # as few messages as possible under Telegram's 4096-char cap
+    packed = []
+    for text in texts:
+        if packed and len(packed[-1]) + 2 + len(text) <= limit:
+            packed[-1] += "\n\n" + text
+        else:
+            packed.append(text[:limit])
+    return packed
+
+async def send_orders_to_group_async(orders):
     if not bot:
         return
     if ORDER_GROUP_ID:
+        # order_sender already holds the slot for the first message
+        for i, text in enumerate(pack_messages([order_text(o) for o in orders])):
+            if i:
+                await wait_group_slot()
+            try:
+                try:
+                    await bot.send_message(ORDER_GROUP_ID, text)
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    await bot.send_message(ORDER_GROUP_ID, text)
+            except Exception as e:
+                print("Failed to send order to group:", e)
+
+ORDER_BATCH_WINDOW = 0.2  # seconds to wait for more orders before sending
+ORDER_BATCH_MAX = 10
+
+async def order_sender(q):
+    # single consumer: orders arriving close together go out as one message
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await q.get()]
+        deadline = loop.time() + ORDER_BATCH_WINDOW
+        while len(batch) < ORDER_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(q.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # anything that arrived while waiting on the rate limit rides along
+        await wait_group_slot()
+        while True:
+            try:
+                batch.append(q.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        await send_orders_to_group_async(batch)
+
+ORDER_CSV_FIELDS = ["id", "time", "product_id", "product_name", "price", "qty", "name", "phone", "note"]
+
+def build_orders_csv():
+    # rows go straight from the order log into an in-memory buffer: no temp
+    # file and no handle left for the GC to close
+    with io.BytesIO() as buf:
+        out = io.TextIOWrapper(buf, encoding="utf-8", newline="", write_through=True)
+        w = csv.writer(out)
+        w.writerow(ORDER_CSV_FIELDS)
+        for o in iter_orders():
+            w.writerow([o.get(k, "") for k in ORDER_CSV_FIELDS])
+        out.detach()
+        return buf.getvalue()
+
+# (file state -> totals) so repeated /report calls skip re-reading the log
+_report_cache = (None, None)
+
+def _file_state(path):
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def order_totals():
+    global _report_cache
+    key = _file_state(ORDERS_FILE)
+    if _report_cache[1] is not None and _report_cache[0] == key:
+        return _report_cache[1]
+    count, total_qty, total_sum = 0, 0.0, 0.0
+    for o in iter_orders():
         try:
-            await bot.send_message(ORDER_GROUP_ID, build_text(order))
-        except Exception as e:
-            print("Failed to send order to group:", e)
+            qty = float(o.get("qty", 0))
+            price = float(o.get("price", 0))
+        except (TypeError, ValueError):
+            continue
+        count += 1
+        total_qty += qty
+        total_sum += qty * price
+    totals = (count, total_qty, total_sum)
+    _report_cache = (key, totals)
+    return totals
 
 if dp and types:
     @dp.message(Command("start"))
@@ -316,7 +816,83 @@ if dp and types:
         markup = types.InlineKeyboardMarkup(inline_keyboard=kb)
         await m.answer("Добро пожаловать", reply_markup=markup)
 
+    @dp.message(Command("export"))
+    async def export_cmd(m: types.Message):
+        # only the order group may pull the order list
+        if not ORDER_GROUP_ID or m.chat.id != ORDER_GROUP_ID:
+            return
+        filename = f"orders_{datetime.date.today().isoformat()}.csv"
+        # reading the whole log would stall every other update on this loop
+        data = await asyncio.to_thread(build_orders_csv)
+        await m.answer_document(types.BufferedInputFile(data, filename=filename))
+
+    @dp.message(Command("report"))
+    async def report_cmd(m: types.Message):
+        if not ORDER_GROUP_ID or m.chat.id != ORDER_GROUP_ID:
+            return
+        count, total_qty, total_sum = await asyncio.to_thread(order_totals)
+        await m.answer(
+            f"📊 Hisobot\n"
+            f"Buyurtmalar: {count}\n"
+            f"Jami miqdor: {total_qty:g}\n"
+            f"Jami summa: {total_sum:,.0f} so'm"
+        )
+
+# --- Telegram webhook ---
+@app.route("/tg", methods=["POST"])
+def telegram_webhook():
+    aioloop = globals().get("aioloop")
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not dp or not aioloop:
+        return "Not found", 404
+    if not hmac.compare_digest(secret.encode("utf-8"), WEBHOOK_SECRET.encode("utf-8")):
+        return "Not found", 404
+    update = request.get_json(silent=True)
+    if not update:
+        return "Bad request", 400
+    # answer Telegram right away; the bot loop handles the update
+    asyncio.run_coroutine_threadsafe(dp.feed_raw_update(bot, update), aioloop)
+    return "", 200
+
+async def setup_webhook():
+    url = f"{WEB_URL.rstrip('/')}/tg"
+    try:
+        await bot.set_webhook(url, secret_token=WEBHOOK_SECRET)
+        print("Webhook set.")
+    except Exception as e:
+        print("Failed to set webhook:", e)
+
+async def start_polling():
+    # getUpdates is refused while a webhook from an earlier deploy is still set
+    try:
+        await bot.delete_webhook()
+    except Exception as e:
+        print("Failed to delete webhook:", e)
+    await dp.start_polling(bot)
+
 # --- Run server + bot ---
+def new_bot_loop():
+    aioloop = asyncio.new_event_loop()
+    globals()["aioloop"] = aioloop
+    globals()["order_queue"] = asyncio.Queue()
+    aioloop.create_task(order_sender(globals()["order_queue"]))
+    return aioloop
+
+def start_background_loop(webhook=False):
+    # the bot loop only runs handlers and sends; the web server receives updates
+    aioloop = new_bot_loop()
+    if webhook:
+        aioloop.create_task(setup_webhook())
+    threading.Thread(target=aioloop.run_forever, daemon=True).start()
+
+WEBHOOK_MODE = bool(bot and dp and WEBHOOK_SECRET and WEB_URL)
+if WEBHOOK_MODE:
+    start_background_loop(webhook=True)
+elif bot and __name__ != "__main__":
+    # served by gunicorn while the worker process polls: this process still
+    # needs a loop of its own to forward orders, or they never reach the group
+    start_background_loop()
+
 def run_flask():
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, threaded=True)
@@ -326,305 +902,30 @@ def run_bot_loop():
         print("Bot not configured or aiogram missing. Running web only.")
         return
 
-    aioloop = asyncio.new_event_loop()
+    aioloop = new_bot_loop()
     asyncio.set_event_loop(aioloop)
-    globals()["aioloop"] = aioloop
 
     print("Starting aiogram polling...")
     try:
-        aioloop.run_until_complete(dp.start_polling(bot))
+        aioloop.run_until_complete(start_polling())
     except Exception as e:
         print("Polling stopped:", e)
 
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    print("Flask started.")
-
-    if not bot or not dp:
-        print("Web only mode (Telegram disabled).")
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("Shutting down.")
+    if WEBHOOK_MODE:
+        print("Webhook mode.")
+        run_flask()
     else:
-        run_bot_loop()
-```
-
----
-
-## File: `requirements.txt`
-
-```
-Flask>=2.0
-aiogram==3.4.1
-aiohttp>=3.8
-python-dotenv>=1.0
-gunicorn>=21.2
-Werkzeug>=2.0
-```
-
----
-
-## File: `Procfile`
-
-```
-web: gunicorn --bind 0.0.0.0:$PORT main:app
-worker: python main.py
-```
-
----
-
-## File: `runtime.txt`
-
-```
-python-3.11.16
-```
-
----
-
-## File: `.gitignore`
-
-```
-.env
-__pycache__/
-*.pyc
-.vscode/
-instance/
-```
-
----
-
-## File: `database.json` (expanded — 9 products)
-
-```json
-{
-  "products": [
-    {
-      "id": "p1",
-      "name_uz": "Go'shtli chuchvara — 1 kg",
-      "name_ru": "Пельмени с говядиной — 1 кг",
-      "price": 45000,
-      "image": "images/chuchvara_beef_1kg.jpg",
-      "desc_uz": "Yuqori sifatli mol go‘shtidan tayyorlangan.",
-      "desc_ru": "Приготовлены из высококачественной говядины."
-    },
-    {
-      "id": "p2",
-      "name_uz": "Tovuqli chuchvara — 1 kg",
-      "name_ru": "Пельмени с курицей — 1 кг",
-      "price": 33000,
-      "image": "images/chuchvara_chicken_1kg.jpg",
-      "desc_uz": "Yengil va mazali tovuq go‘shtidan tayyorlangan.",
-      "desc_ru": "Нежные и вкусные пельмени с курицей."
-    },
-    {
-      "id": "p3",
-      "name_uz": "Tovuqli chuchvara — 500 g",
-      "name_ru": "Пельмени с курицей — 500 г",
-      "price": 17500,
-      "image": "images/chuchvara_chicken_500g.jpg",
-      "desc_uz": "Kichik oila uchun qulay o‘ram.",
-      "desc_ru": "Удобная упаковка для небольшой семьи."
-    },
-    {
-      "id": "p4",
-      "name_uz": "Qo'ziqorinli chuchvara — 1 kg",
-      "name_ru": "Пельмени с грибами — 1 кг",
-      "price": 38000,
-      "image": "images/chuchvara_mushroom_1kg.jpg",
-      "desc_uz": "Tabiiy qoʻziqorinlar va maxsus ziravorlar bilan.",
-      "desc_ru": "С натуральными грибами и специальными приправами."
-    },
-    {
-      "id": "p5",
-      "name_uz": "Krem-sirli chuchvara — 1 kg",
-      "name_ru": "Пельмени с сыром — 1 кг",
-      "price": 39000,
-      "image": "images/chuchvara_cheese_1kg.jpg",
-      "desc_uz": "Ichida eritilgan krem-sir bilan boy taʼm.",
-      "desc_ru": "Богатый вкус с расплавленным крем-сыром внутри."
-    },
-    {
-      "id": "p6",
-      "name_uz": "Sabzavotli vegetarian chuchvara — 1 kg",
-      "name_ru": "Вегетарианские пельмени с овощами — 1 кг",
-      "price": 30000,
-      "image": "images/chuchvara_veggie_1kg.jpg",
-      "desc_uz": "Sabzavotlar bilan to‘ldirilgan, vegetarian uchun mos.",
-      "desc_ru": "С начинкой из овощей, подходит для вегетарианцев."
-    },
-    {
-      "id": "p7",
-      "name_uz": "Qizil baliqli chuchvara — 1 kg",
-      "name_ru": "Пельмени с лососем — 1 кг",
-      "price": 52000,
-      "image": "images/chuchvara_salmon_1kg.jpg",
-      "desc_uz": "Yuqori sifatli qizil baliqdan tayyorlangan.",
-      "desc_ru": "Приготовлены из высококачественного лосося."
-    },
-    {
-      "id": "p8",
-      "name_uz": "Achchiq qoʻy goʻshtli chuchvara — 1 kg",
-      "name_ru": "Острые пельмени со бараниной — 1 кг",
-      "price": 47000,
-      "image": "images/chuchvara_spicy_lamb_1kg.jpg",
-      "desc_uz": "Anʼanaviy ziravorlar bilan achchiq lazzat.",
-      "desc_ru": "Острый вкус с традиционными специями."
-    },
-    {
-      "id": "p9",
-      "name_uz": "Aralash toʻplam (3x500g) — sovg'a paketi",
-      "name_ru": "Сборный набор (3x500г) — подарочная упаковка",
-      "price": 82000,
-      "image": "images/chuchvara_mixed_pack_3x500g.jpg",
-      "desc_uz": "Turli xil taʼmlar: mol, tovuq va qoʻziqorin — oilaviy variant.",
-      "desc_ru": "Разные вкусы: говядина, курица и грибы — для семейного употребления."
-    }
-  ],
-  "orders": [],
-  "admins": [
-    {
-      "username": "admin",
-      "password": "12345"
-    }
-  ]
-}
-```
-
----
-
-## `templates/index.html`
-
-```html
-<!doctype html>
-<html>
-<head><meta charset="utf-8"><title>Menu</title></head>
-<body>
-  <h1>Menu</h1>
-  <ul>
-    {% for p in products %}
-      <li>
-        <a href="{{ url_for('order', product_id=p.id) }}">
-          {{ p['name_ru'] if lang=='ru' else p['name_uz'] }} — {{ p.price }} сум
-        </a>
-      </li>
-    {% endfor %}
-  </ul>
-</body>
-</html>
-```
-
----
-
-## `templates/order.html`
-
-```html
-<!doctype html>
-<html>
-<head><meta charset="utf-8"><title>Order</title></head>
-<body>
-  <h1>{{ product['name_ru'] if lang=='ru' else product['name_uz'] }}</h1>
-  <form method="post">
-    <input type="hidden" name="lang" value="{{ lang }}">
-    <label>Ism: <input name="name"></label><br>
-    <label>Tel: <input name="phone"></label><br>
-    <label>Soni: <input name="qty" value="1"></label><br>
-    <label>Izoh: <textarea name="note"></textarea></label><br>
-    <button type="submit">Buyurtma</button>
-  </form>
-</body>
-</html>
-```
-
----
-
-## `templates/ordered.html`
-
-```html
-<!doctype html>
-<html><head><meta charset="utf-8"><title>Ordered</title></head>
-<body>
-  <h1>Buyurtma qabul qilindi</h1>
-  <p>Buyurtma ID: {{ order.id }}</p>
-  <p>Mahsulot: {{ order.product_name }}</p>
-  <p>Soni: {{ order.qty }}</p>
-  <a href="{{ url_for('index') }}">Orqaga</a>
-</body></html>
-```
-
----
-
-## `templates/login.html`
-
-```html
-<!doctype html>
-<html><head><meta charset="utf-8"><title>Admin login</title></head>
-<body>
-  <h1>Admin login</h1>
-  {% if error %}<p style="color:red">{{ error }}</p>{% endif %}
-  <form method="post">
-    <label>Username: <input name="username"></label><br>
-    <label>Password: <input name="password" type="password"></label><br>
-    <button type="submit">Kirish</button>
-  </form>
-</body></html>
-```
-
----
-
-## `templates/admin.html`
-
-```html
-<!doctype html>
-<html><head><meta charset="utf-8"><title>Admin</title></head>
-<body>
-  <h1>Admin panel</h1>
-  <h2>Products</h2>
-  <ul>
-  {% for p in products %}
-    <li>{{ p.id }} - {{ p.name_ru }}</li>
-  {% endfor %}
-  </ul>
-  <h2>Orders</h2>
-  <ul>
-  {% for o in orders %}
-    <li>{{ o.id }} — {{ o.product_name }} — {{ o.name }}</li>
-  {% endfor %}
-  </ul>
-  <a href="{{ url_for('admin_logout') }}">Logout</a>
-</body></html>
-```
-
----
-
-## `.env.example`
-
-```
-BOT_TOKEN=
-ORDER_GROUP_ID=
-WEB_URL=
-SECRET_KEY=
-```
-
----
-
-## `README.md` (brief)
-
-```markdown
-# Altindan_bot — Flask + aiogram mini app
-
-Simple web shop + Telegram bot. Uses JSON file as DB.
-
-## Run locally
-1. Copy `.env.example` to `.env` and set your BOT_TOKEN and ORDER_GROUP_ID.
-2. `pip install -r requirements.txt`
-3. `python main.py`
-4. Open `http://127.0.0.1:5000`
-
-## Deploy (Render)
-- Add `runtime.txt` with `python-3.11.16`
-- Add `Procfile` and `requirements.txt`
-- In Render → Environment variables add `BOT_TOKEN` and `ORDER_GROUP_ID`
-```
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
+        print("Flask started.")
+
+        if not bot or not dp:
+            print("Web only mode (Telegram disabled).")
+            try:
+                # park until a signal arrives instead of waking every second
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                print("Shutting down.")
+        else:
+            run_bot_loop()